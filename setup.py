@@ -49,12 +49,16 @@ prometheus_requirements = [
     'pympler',
 ]
 
+# compiles the REVO resampler kernels
+numba_requirements = ['numba']
+
 # # combination of all the extras requirements
 all_requirements = list(it.chain.from_iterable([
     base_requirements,
     md_requirements,
     distributed_requirements,
     prometheus_requirements,
+    numba_requirements,
 ]))
 
 setup(
@@ -106,6 +110,7 @@ setup(
         'md' : md_requirements,
         'distributed' : distributed_requirements,
         'prometheus' : prometheus_requirements,
+        'numba' : numba_requirements,
         'all' : all_requirements,
     }
 )
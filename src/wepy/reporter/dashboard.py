@@ -2,12 +2,15 @@
 information on the progress of a simulation.
 
 """
+import os
+import array
 from collections import defaultdict
 import itertools as it
 import logging
 from datetime import datetime
 import time
 from copy import copy
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
@@ -18,6 +21,25 @@ import logging
 
 from wepy.reporter.reporter import ProgressiveFileReporter
 
+@lru_cache(maxsize=None)
+def compiled_template(template_str):
+    """Get the compiled jinja2 Template for a template string.
+
+    Templates are compiled only once and then reused on every render.
+
+    Parameters
+    ----------
+    template_str : str
+        The jinja2 template source.
+
+    Returns
+    -------
+    template : jinja2.Template
+
+    """
+
+    return Template(template_str)
+
 class DashboardReporter(ProgressiveFileReporter):
     """A text based report of the status of a wepy simulation.
 
@@ -94,6 +116,9 @@ Worker Avg. Segment Times:
 """
 
 
+    WRITE_BUFFER_SIZE = 1 << 20
+    """Size in bytes of the buffer used when writing the dashboard file."""
+
     def __init__(self,
                  resampler_dash=None,
                  runner_dash=None,
@@ -136,10 +161,12 @@ Worker Avg. Segment Times:
 
 
         # performance
-        self.cycle_compute_times = []
-        self.cycle_runner_times = []
-        self.cycle_bc_times = []
-        self.cycle_resampling_times = []
+        # the times are kept as unboxed doubles which numpy can use
+        # directly without copying
+        self.cycle_compute_times = array.array('d')
+        self.cycle_runner_times = array.array('d')
+        self.cycle_bc_times = array.array('d')
+        self.cycle_resampling_times = array.array('d')
         self.worker_records = []
 
 
@@ -154,12 +181,15 @@ Worker Avg. Segment Times:
 
     def calc_walker_summary(self, **kwargs):
 
-        walker_weights = [walker.weight for walker in kwargs['new_walkers']]
+        # convert to an array once instead of in each reduction
+        walker_weights = np.fromiter((walker.weight for walker in kwargs['new_walkers']),
+                                     dtype=np.float64,
+                                     count=len(kwargs['new_walkers']))
 
         summary = {
-            'total' : np.sum(walker_weights),
-            'min' : np.min(walker_weights),
-            'max' : np.max(walker_weights),
+            'total' : walker_weights.sum(),
+            'min' : walker_weights.min(),
+            'max' : walker_weights.max(),
         }
 
         return summary
@@ -231,20 +261,34 @@ Worker Avg. Segment Times:
         self.cycle_compute_times.append(cycle_time)
 
         # average of cycle components times
-        self.avg_runner_time = np.mean(self.cycle_runner_times)
-        self.avg_bc_time = np.mean(self.cycle_bc_times)
-        self.avg_resampling_time = np.mean(self.cycle_resampling_times)
+        self.avg_runner_time = np.mean(np.frombuffer(self.cycle_runner_times))
+        self.avg_bc_time = np.mean(np.frombuffer(self.cycle_bc_times))
+        self.avg_resampling_time = np.mean(np.frombuffer(self.cycle_resampling_times))
 
         # average cycle time
-        self.avg_cycle_time = np.mean(self.cycle_compute_times)
+        self.avg_cycle_time = np.mean(np.frombuffer(self.cycle_compute_times))
+
+
+
+    def write_dashboard(self, report_chunks):
+        """Write the dashboard to the file.
 
+        Parameters
+        ----------
+        report_chunks : iterable of str
+            The pieces of the dashboard text, in order.
 
+        """
 
-    def write_dashboard(self, report_str):
-        """Write the dashboard to the file."""
+        # write all the pieces through one large buffer to a temporary
+        # file and then swap it in, so that readers never see a
+        # partially written dashboard
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, mode=self.mode,
+                  buffering=self.WRITE_BUFFER_SIZE) as dashboard_file:
+            dashboard_file.writelines(report_chunks)
 
-        with open(self.file_path, mode=self.mode) as dashboard_file:
-            dashboard_file.write(report_str)
+        os.replace(tmp_path, self.file_path)
 
     def gen_sim_section(self, **kwargs):
         """"""
@@ -264,7 +308,7 @@ Worker Avg. Segment Times:
             'walker_cycle_summary_table' : walker_summary_tbl_str,
         }
 
-        sim_section_str = Template(self.SIMULATION_SECTION_TEMPLATE).render(
+        sim_section_str = compiled_template(self.SIMULATION_SECTION_TEMPLATE).render(
             **sim_section_d
         )
 
@@ -272,17 +316,13 @@ Worker Avg. Segment Times:
 
     def gen_performance_section(self, **kwargs):
 
-        # log of cycle times
-        cycle_table_colnames = ('cycle_time (s)',
-                                'runner_time (s)',
-                                'boundary_conditions_time (s)',
-                                'resampling_time (s)')
-
-        cycle_table_df = pd.DataFrame({'cycle_times (s)' : self.cycle_compute_times,
-                                       'runner_time (s)' : self.cycle_runner_times,
-                                       'boundary_conditions_time (s)' : self.cycle_bc_times,
-                                       'resampling_time (s)' : self.cycle_resampling_times},
-                                      columns=cycle_table_colnames)
+        # log of cycle times, the columns are in the order of the dict
+        # copies are made here since a view would stop the arrays
+        # from being appended to while the table is alive
+        cycle_table_df = pd.DataFrame({'cycle_time (s)' : np.array(self.cycle_compute_times),
+                                       'runner_time (s)' : np.array(self.cycle_runner_times),
+                                       'boundary_conditions_time (s)' : np.array(self.cycle_bc_times),
+                                       'resampling_time (s)' : np.array(self.cycle_resampling_times)})
 
         cycle_table_str = tabulate(cycle_table_df,
                                    headers=cycle_table_df.columns,
@@ -315,7 +355,7 @@ Worker Avg. Segment Times:
             'avg_resampling_time' : self.avg_resampling_time,
         }
 
-        performance_section_str = Template(self.PERFORMANCE_SECTION_TEMPLATE).render(
+        performance_section_str = compiled_template(self.PERFORMANCE_SECTION_TEMPLATE).render(
             **performance_section_d
         )
 
@@ -350,8 +390,9 @@ Worker Avg. Segment Times:
         else:
             bc_section_str = None
 
-        # render the whole template
-        report_str = Template(self.DASHBOARD_TEMPLATE).render(
+        # render the whole template piece by piece as it is written
+        # out, rather than joining it into one string first
+        report_chunks = compiled_template(self.DASHBOARD_TEMPLATE).generate(
             simulation=sim_section_str,
             resampler=resampler_section_str,
             boundary_condition=bc_section_str,
@@ -360,7 +401,7 @@ Worker Avg. Segment Times:
         )
 
         # write the thing
-        self.write_dashboard(report_str)
+        self.write_dashboard(report_chunks)
 
 
 
@@ -400,7 +441,7 @@ Resampler: {{ name }}
 
         section_kwargs = self.gen_fields(**kwargs)
 
-        section_str = Template(self.RESAMPLER_SECTION_TEMPLATE).render(
+        section_str = compiled_template(self.RESAMPLER_SECTION_TEMPLATE).render(
             **section_kwargs
         )
 
@@ -443,7 +484,7 @@ Runner: {{ name }}
         section_kwargs = self.gen_fields(**kwargs)
 
 
-        section_str = Template(self.RUNNER_SECTION_TEMPLATE).render(
+        section_str = compiled_template(self.RUNNER_SECTION_TEMPLATE).render(
             **section_kwargs
         )
 
@@ -513,33 +554,46 @@ Cumulative Boundary Crossed Weight: {{ total_crossed_weight }}
         # is useful for rate calculations via Hill's relation.
         self.total_n_walker_segments += len(kwargs['new_walkers'])
 
+        warp_data = kwargs['warp_data']
+        n_warps = len(warp_data)
+
+        # nothing more to do if there were no warps
+        if n_warps == 0:
+            return
+
+        # pull the values out of the warp records in one pass each
+        weights = np.fromiter((warp_record['weight'][0] for warp_record in warp_data),
+                              dtype=np.float64, count=n_warps)
+        walker_idxs = np.fromiter((warp_record['walker_idx'][0] for warp_record in warp_data),
+                                  dtype=np.int64, count=n_warps)
+        target_idxs = np.fromiter((warp_record['target_idx'][0] for warp_record in warp_data),
+                                  dtype=np.int64, count=n_warps)
+
+        # determine if they were discontinuous
+
+        # all targets are discontinuous
+        if self.bc_discontinuities is Ellipsis:
+            disconts = np.ones(n_warps, dtype=bool)
+        # none of them are discontinuous
+        elif self.bc_discontinuities is None:
+            disconts = np.zeros(n_warps, dtype=bool)
+        # then it is a list of the discontinuous targets
+        else:
+            disconts = np.isin(target_idxs, list(self.bc_discontinuities))
+
         # just create the bare warp records, since we know no more
         # domain knowledge, feel free to override and add more data to
         # this table
-        for warp_record in kwargs['warp_data']:
-
-            # the cycle
-            cycle_idx = kwargs['cycle_idx']
-
-            # the individual values from the warp record
-            weight = warp_record['weight'][0]
-            walker_idx = warp_record['walker_idx'][0]
-            target_idx = warp_record['target_idx'][0]
-
-            # determine if it was discontinuous
-
-            # all targets are discontinuous
-            if self.bc_discontinuities is Ellipsis:
-                discont = True
-            # none of them are discontinuous
-            elif self.bc_discontinuities is None:
-                discont = False
-            # then it is a list of the discontinuous targets
-            else:
-                discont = True if target_idx in self.bc_discontinuities else False
+        self.warp_records.extend(zip(it.repeat(kwargs['cycle_idx']),
+                                     walker_idxs.tolist(),
+                                     weights.tolist(),
+                                     target_idxs.tolist(),
+                                     disconts.tolist()))
 
-            record = (cycle_idx, walker_idx, weight, target_idx, discont)
-            self.warp_records.append(record)
+        # keep running totals so we never have to go back over
+        # all the records
+        self.total_crossings += n_warps
+        self.total_crossed_weight += weights.sum()
 
 
     def gen_fields(self, **kwargs):
@@ -564,7 +618,7 @@ Cumulative Boundary Crossed Weight: {{ total_crossed_weight }}
 
         section_kwargs = self.gen_fields(**kwargs)
 
-        section_str = Template(self.BC_SECTION_TEMPLATE).render(
+        section_str = compiled_template(self.BC_SECTION_TEMPLATE).render(
             **section_kwargs
         )
 
@@ -1,7 +1,5 @@
 from pint import UnitRegistry
-from jinja2 import Template
-
-from wepy.reporter.dashboard import BCDashboardSection
+from wepy.reporter.dashboard import BCDashboardSection, compiled_template
 
 # initialize the unit registry
 units = UnitRegistry()
@@ -57,7 +55,11 @@ Parameters:
         # 'new_walkers' are received in the 'total_n_walkers'
         # attribute
 
-        rate = self.total_crossed_weight / self.total_n_walker_segments
+        # before any segments are run the rate is just zero
+        if self.total_n_walker_segments > 0:
+            rate = self.total_crossed_weight / self.total_n_walker_segments
+        else:
+            rate = 0.
 
         new_fields = {
             'parameters' : '',
@@ -104,7 +106,7 @@ Cutoff Distance: {{ cutoff_distance }}
 
         fields = super().gen_fields(**kwargs)
 
-        parameters_str = Template(self.RECEPTOR_PARAMETERS).render(
+        parameters_str = compiled_template(self.RECEPTOR_PARAMETERS).render(
             cutoff_distance=self.cutoff_distance,
         )
 
@@ -143,7 +145,7 @@ Cutoff RMSD: {{ cutoff_rmsd }}
 
         fields = super().gen_fields(**kwargs)
 
-        parameters_str = Template(self.RECEPTOR_PARAMETERS).render(
+        parameters_str = compiled_template(self.RECEPTOR_PARAMETERS).render(
             cutoff_rmsd=self.cutoff_rmsd,
         )
 
@@ -93,13 +93,18 @@ Variation value = {{ variation }}
 
     def update_values(self, **kwargs):
 
+        # look up the decision values once instead of for every walker
+        clone_value = self.decision.ENUM.CLONE.value
+        keep_merge_value = self.decision.ENUM.KEEP_MERGE.value
+
         num_clones = 0
         num_merges = 0
         num_walkers = len(kwargs['resampling_data'])
         for walker_record in kwargs['resampling_data']:
-            if walker_record['decision_id'][0]==self.decision.ENUM.CLONE.value:
+            decision_id = walker_record['decision_id'][0]
+            if decision_id == clone_value:
                 num_clones += 1
-            elif walker_record['decision_id'][0]==self.decision.ENUM.KEEP_MERGE.value:
+            elif decision_id == keep_merge_value:
                 num_merges += 1
 
         self.percentage_cloned_walkers = (num_clones/num_walkers) * 100
@@ -111,9 +116,16 @@ Variation value = {{ variation }}
             distance_matrix = resampler_record['distance_matrix']
 
 
+        # the distance matrix is saved flattened so we reshape it to
+        # the square matrix without copying, rather than building a
+        # triangle over every element of the flat array
+        distance_matrix = np.asarray(distance_matrix, dtype=np.float64)
+        n_images = int(round(np.sqrt(distance_matrix.size)))
+        distance_matrix = distance_matrix.reshape((n_images, n_images))
+
         #get the upper triangle values of the distance_matrix
-        distance_matrix = np.triu(distance_matrix)
-        distance_values= distance_matrix[np.where(distance_matrix>0)]
+        distance_values = distance_matrix[np.triu_indices(n_images, k=1)]
+        distance_values = distance_values[distance_values > 0]
         self.avg_distance = np.average(distance_values)
         self.min_distance = np.min(distance_values)
         self.max_distance  = np.max(distance_values)
@@ -1,13 +1,12 @@
 import os.path as osp
-from collections import defaultdict
-import itertools as it
+from collections import defaultdict, Counter
+import bisect
 import logging
 from warnings import warn
 
 from wepy.reporter.dashboard import ResamplerDashboardSection
 
 import numpy as np
-import pandas as pd
 from tabulate import tabulate
 
 class WExploreDashboardSection(ResamplerDashboardSection):
@@ -78,14 +77,28 @@ Defined Regions with the number of child regions per parent region:
         self.root_region = ()
         init_leaf_region = tuple([0 for i in range(self.n_levels)])
         self.region_ids = [init_leaf_region]
+
+        # the region hierarchy only changes when new leaves are made
+        # so the values derived from it are only recomputed then,
+        # nothing has been computed yet
+        self._regions_changed = True
+        self._region_hierarchy_str = None
+
+        # all of the regions, i.e. the leaves and all of their
+        # parents, kept sorted and added to as new leaves are made
+        self._all_regions_set = set()
+        self._all_regions_sorted = []
+        self._add_region_prefixes(init_leaf_region)
+
         self.regions_per_level = []
         self.children_per_region = {}
 
         # resampling
+        self.walker_weights = np.zeros(0)
         self.walker_assignments = []
         self.walker_image_distances = []
-        self.curr_region_probabilities = defaultdict(int)
-        self.curr_region_counts = defaultdict(int)
+        self.curr_region_probabilities = defaultdict(float)
+        self.curr_region_counts = Counter()
 
         #wexplore
         self.branch_records = []
@@ -93,147 +106,167 @@ Defined Regions with the number of child regions per parent region:
 
     def _leaf_regions_to_all_regions(self, region_ids):
 
-        # make a set of all the regions starting with the root region
-        regions = set([self.root_region])
-        for region_id in region_ids:
-            for i in range(len(region_id)):
-                regions.add(region_id[0:i+1])
+        # all the prefixes of every region plus the root region
+        return sorted({region_id[0:i+1]
+                       for region_id in region_ids
+                       for i in range(len(region_id))} | {self.root_region})
 
-        regions = list(regions)
-        regions.sort()
 
-        return regions
+    def _add_region_prefixes(self, region_id):
+        """Add a leaf region and all of its parent regions (including
+        the root) to the sorted collection of all regions."""
 
+        for i in range(len(region_id) + 1):
+            region_prefix = region_id[0:i]
+            if region_prefix not in self._all_regions_set:
+                self._all_regions_set.add(region_prefix)
+                bisect.insort(self._all_regions_sorted, region_prefix)
+                self._regions_changed = True
 
     def update_values(self, **kwargs):
 
-        # the region assignments for walkers
-        assignments = []
-        walker_weights = [walker.weight for walker in kwargs['new_walkers']]
-        # re-initialize the current weights dictionary
-        self.curr_region_probabilities = defaultdict(int)
-        self.curr_region_counts = defaultdict(int)
-        for walker_record in kwargs['resampling_data']:
-
-            assignment = tuple(walker_record['region_assignment'])
-            walker_idx = walker_record['walker_idx'][0]
-            assignments.append((walker_idx, assignment))
-
-            # calculate the probabilities and counts of the regions
-            # given the current distribution of walkers
-            self.curr_region_probabilities[assignment] += walker_weights[walker_idx]
-            self.curr_region_counts[assignment] += 1
-
-        # sort them to get the walker indices in the right order
-        assignments.sort()
-        # then just get the assignment since it is sorted
-        self.walker_assignments = [assignment for walker, assignment in assignments]
-
-        # add to the records for region creation in WExplore
-        for resampler_record in kwargs['resampler_data']:
-
-            # get the values
-            new_leaf_id = tuple(resampler_record['new_leaf_id'])
-            branching_level = resampler_record['branching_level'][0]
-            walker_image_distance = resampler_record['distance'][0]
-
-            # add the new leaf id to the list of regions in the order they were created
-            self.region_ids.append(new_leaf_id)
-
-            # make a new record for a branching event which is:
-            # (region_id, level branching occurred, distance of walker that triggered the branching)
-            branch_record = (new_leaf_id,
-                             branching_level,
-                             walker_image_distance)
+        # keep the weights of the walkers as an array for the
+        # aggregations here and the walker table
+        self.walker_weights = np.fromiter((walker.weight for walker in kwargs['new_walkers']),
+                                          dtype=np.float64,
+                                          count=len(kwargs['new_walkers']))
 
-            # save it in the records
-            self.branch_records.append(branch_record)
-
-        # count the number of child regions each region has
-        self.children_per_region = {}
-        all_regions = self._leaf_regions_to_all_regions(self.region_ids)
-        for region_id in all_regions:
-            # if its a leaf region it has no children
-            if len(region_id) == self.n_levels:
-                self.children_per_region[region_id] = 0
-
-            # all others we cound how many children it has
-            else:
-                # get all regions that have this one as a root
-                children_idxs = set()
-                for poss_child_id in all_regions:
-
-                    # get the root at the level of this region for the child
-                    poss_child_root = poss_child_id[0:len(region_id)]
-                    # if the root is the same we keep it without
-                    # counting children below the next level, but we skip the same region
-                    if (poss_child_root == region_id) and (poss_child_id != region_id):
-
-                        child_idx = poss_child_id[len(region_id)]
-
-                        children_idxs.add(child_idx)
-
-                # count the children of this region
-                self.children_per_region[region_id] = len(children_idxs)
-
-        # count the number of regions at each level
-        self.regions_per_level = [0 for i in range(self.n_levels)]
-        for region_id, n_children in self.children_per_region.items():
-            level = len(region_id)
-
-            # skip the leaves
-            if level == self.n_levels:
-                continue
+        # the region assignments for walkers, the walker indices cover
+        # all of the walkers so we put them right in place
+        walker_assignments = [None for _ in range(len(kwargs['resampling_data']))]
+        for walker_record in kwargs['resampling_data']:
 
-            self.regions_per_level[level] += n_children
+            assignment = tuple(np.asarray(walker_record['region_assignment']).tolist())
+            walker_idx = int(walker_record['walker_idx'][0])
+            walker_assignments[walker_idx] = assignment
+
+        self.walker_assignments = walker_assignments
+
+        # calculate the probabilities and counts of the regions given
+        # the current distribution of walkers
+        self.curr_region_counts = Counter(self.walker_assignments)
+
+        # give each occupied region a dense index so the weights can
+        # be summed per region in one go
+        region_idxs = {region : i for i, region in enumerate(self.curr_region_counts)}
+        walker_region_idxs = np.fromiter((region_idxs[assignment]
+                                          for assignment in self.walker_assignments),
+                                         dtype=np.intp,
+                                         count=len(self.walker_assignments))
+        region_weights = np.bincount(walker_region_idxs,
+                                     weights=self.walker_weights,
+                                     minlength=len(region_idxs))
+
+        self.curr_region_probabilities = defaultdict(float,
+                                                     zip(region_idxs, region_weights.tolist()))
+
+        # add to the records for region creation in WExplore, the
+        # values are converted to python numbers in bulk
+        resampler_data = kwargs['resampler_data']
+        new_leaf_ids = [tuple(np.asarray(resampler_record['new_leaf_id']).tolist())
+                        for resampler_record in resampler_data]
+        branching_levels = [int(resampler_record['branching_level'][0])
+                            for resampler_record in resampler_data]
+        walker_image_distances = [float(resampler_record['distance'][0])
+                                  for resampler_record in resampler_data]
+
+        # add the new leaf ids to the list of regions in the order they were created
+        self.region_ids.extend(new_leaf_ids)
+        for new_leaf_id in new_leaf_ids:
+            self._add_region_prefixes(new_leaf_id)
+
+        # make new records for the branching events which are:
+        # (region_id, level branching occurred, distance of walker that triggered the branching)
+        self.branch_records.extend(zip(new_leaf_ids,
+                                       branching_levels,
+                                       walker_image_distances))
+
+        # only recount the regions if new ones were added
+        if self._regions_changed:
+            self._regions_changed = False
+            self._region_hierarchy_str = None
+
+            # count the number of child regions each region has
+            self.children_per_region = {}
+            all_regions = self._all_regions_sorted
+            for region_id in all_regions:
+                # if its a leaf region it has no children
+                if len(region_id) == self.n_levels:
+                    self.children_per_region[region_id] = 0
+
+                # all others we cound how many children it has
+                else:
+                    # get all regions that have this one as a root
+                    children_idxs = set()
+                    for poss_child_id in all_regions:
+
+                        # get the root at the level of this region for the child
+                        poss_child_root = poss_child_id[0:len(region_id)]
+                        # if the root is the same we keep it without
+                        # counting children below the next level, but we skip the same region
+                        if (poss_child_root == region_id) and (poss_child_id != region_id):
+
+                            child_idx = poss_child_id[len(region_id)]
+
+                            children_idxs.add(child_idx)
+
+                    # count the children of this region
+                    self.children_per_region[region_id] = len(children_idxs)
+
+            # count the number of regions at each level
+            self.regions_per_level = [0 for i in range(self.n_levels)]
+            for region_id, n_children in self.children_per_region.items():
+                level = len(region_id)
+
+                # skip the leaves
+                if level == self.n_levels:
+                    continue
+
+                self.regions_per_level[level] += n_children
 
 
     def gen_fields(self, **kwargs):
 
         fields = super().gen_fields(**kwargs)
 
-        regions = self._leaf_regions_to_all_regions(self.region_ids)
-        region_children = [self.children_per_region[region] for region in regions]
-        region_children_pairs = it.chain(*zip(regions, region_children))
-        region_hierarchy = '\n'.join(
-            ['{}     {}' for i in range(len(regions))]
-        ).format(*region_children_pairs)
+        if self._region_hierarchy_str is None:
+            self._region_hierarchy_str = '\n'.join(
+                f'{region}     {self.children_per_region[region]}'
+                for region in self._all_regions_sorted)
+        region_hierarchy = self._region_hierarchy_str
 
-        # make a table for the regions
+        # make a table for the regions, the rows are given to
+        # tabulate directly since building a DataFrame just to print
+        # it is much slower
         region_table_colnames = ('region', 'n_walkers', 'curr_weight')
-        region_table_d = {}
-        region_table_d['region'] = self.region_ids
-        region_table_d['n_walkers'] = [self.curr_region_counts[region]
-                                       for region in self.region_ids]
-        region_table_d['curr_weight'] = [self.curr_region_probabilities[region]
-                                         for region in self.region_ids]
-        leaf_region_table_df = pd.DataFrame(region_table_d,
-                                            columns=region_table_colnames)
-        leaf_region_table_df.set_index('region', drop=True)
-
-        leaf_region_table_str = tabulate(leaf_region_table_df,
-                                         headers=leaf_region_table_df.columns,
-                                         tablefmt='orgtbl')
+        n_leaves = len(self.region_ids)
+        region_counts = np.fromiter((self.curr_region_counts[region]
+                                     for region in self.region_ids),
+                                    dtype=np.int64, count=n_leaves)
+        region_weights = np.fromiter((self.curr_region_probabilities[region]
+                                      for region in self.region_ids),
+                                     dtype=np.float64, count=n_leaves)
+
+        leaf_region_table_str = tabulate(zip(self.region_ids,
+                                             region_counts.tolist(),
+                                             region_weights.tolist()),
+                                         headers=region_table_colnames,
+                                         tablefmt='orgtbl',
+                                         showindex=True)
 
         # log of branching events
         branching_table_colnames = ('new_leaf_id', 'branching_level', 'trigger_distance')
-        branching_table_df = pd.DataFrame(self.branch_records, columns=branching_table_colnames)
-        branching_table_str = tabulate(branching_table_df,
-                                       headers=branching_table_df.columns,
-                                       tablefmt='orgtbl')
-
-        ## walker weights
-        walker_weights = [walker.weight for walker in kwargs['new_walkers']]
-        # make the table of walkers using pandas, using the order here
+        branching_table_str = tabulate(self.branch_records,
+                                       headers=branching_table_colnames,
+                                       tablefmt='orgtbl',
+                                       showindex=True)
+
+        # make the table of walkers, using the order here
         walker_table_colnames = ('weight', 'assignment')
-        walker_table_d = {}
-        walker_table_d['weight'] = walker_weights
-        walker_table_d['assignment'] = self.walker_assignments
-
-        walker_table_df = pd.DataFrame(walker_table_d, columns=walker_table_colnames)
-        walker_table_str = tabulate(walker_table_df,
-                                    headers=walker_table_df,
-                                    tablefmt='orgtbl')
+        walker_table_str = tabulate(zip(self.walker_weights.tolist(), self.walker_assignments),
+                                    headers=walker_table_colnames,
+                                    tablefmt='orgtbl',
+                                    showindex=True)
 
 
         new_fields = {
@@ -22,6 +22,8 @@ the 'image_distance' to compute distances using only those images.
 
 """
 import logging
+import itertools as it
+
 import numpy as np
 
 class Distance(object):
@@ -77,6 +79,41 @@ class Distance(object):
         """
         raise NotImplementedError
 
+    def image_distance_matrix(self, images):
+        """Compute the all-to-all distance matrix between images of
+        walker states.
+
+        The default implementation just calls `image_distance` on
+        every pair of images. Override this when the distances for all
+        the images can be computed together more efficiently.
+
+        Parameters
+        ----------
+        images : list of objects produced by Distance.image
+
+        Returns
+        -------
+
+        distance_matrix : arraylike of float of shape (n_images, n_images)
+            The symmetric matrix of distances between the images.
+
+        """
+
+        # initialize an all-to-all matrix, with 0.0 for self distances
+        dist_mat = np.zeros((len(images), len(images)))
+
+        # get the combinations of indices for all image pairs
+        for i, j in it.combinations(range(len(images)), 2):
+
+            # calculate the distance between the two images
+            dist = self.image_distance(images[i], images[j])
+
+            # save this in the matrix in both spots
+            dist_mat[i][j] = dist
+            dist_mat[j][i] = dist
+
+        return dist_mat
+
     def distance(self, state_a, state_b):
         """Compute the distance between two states.
 
@@ -116,3 +153,40 @@ class XYEuclideanDistance(Distance):
 
         return np.sqrt((image_a[0] - image_b[0])**2 +
                        (image_a[1] - image_b[1])**2)
+
+    def image_distance_matrix(self, images):
+        """Compute the distances between all the images at once.
+
+        The squared distances are expanded as |a|^2 + |b|^2 - 2 a.b so
+        that all of them come from a single matrix product. This
+        loses precision for points that are close together but far
+        from the origin: around coordinates of 1000 a separation of
+        1.4142e-4 comes out as 1.4150e-4. Those small distances are
+        the ones compared to merge distances, so use `image_distance`
+        pairwise if that matters for your coordinates.
+
+        Parameters
+        ----------
+        images : list of array of float of shape (2)
+            The x and y coordinates of each walker's state.
+
+        Returns
+        -------
+
+        distance_matrix : array of float of shape (n_images, n_images)
+            The euclidean distances between all the images.
+
+        """
+
+        points = np.stack(images).astype(np.float64)
+
+        # expand |a - b|^2 = |a|^2 + |b|^2 - 2 a.b so that all the dot
+        # products are a single matrix product
+        sq_norms = np.einsum('ij,ij->i', points, points)
+        sq_dists = sq_norms[:, None] + sq_norms[None, :] - 2 * (points @ points.T)
+
+        # rounding can make these slightly negative
+        np.maximum(sq_dists, 0.0, out=sq_dists)
+        np.fill_diagonal(sq_dists, 0.0)
+
+        return np.sqrt(sq_dists)
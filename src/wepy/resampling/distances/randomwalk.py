@@ -66,3 +66,27 @@ class RandomWalkDistance(Distance):
 
         """
         return np.average(np.abs(image_a - image_b))
+
+    def image_distance_matrix(self, images):
+        """Compute the distances between all the images at once.
+
+        Parameters
+        ----------
+
+        images : list of array of float of shape (N) or (1, N)
+            Positions of the walkers' states.
+
+        Returns
+        -------
+
+        distance_matrix : array of float of shape (n_images, n_images)
+            The normalized Manhattan distances between all the images.
+
+        """
+
+        # flatten each image since the runner gives positions of shape
+        # (1, N)
+        positions = np.stack(images).reshape(len(images), -1)
+
+        return np.average(np.abs(positions[:, None, :] - positions[None, :, :]),
+                          axis=-1)
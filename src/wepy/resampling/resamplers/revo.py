@@ -1,6 +1,6 @@
-import multiprocessing as mulproc
-import random as rand
-import itertools as it
+import os
+import concurrent.futures as cf
+import pickle
 
 import logging
 from eliot import start_action, log_call
@@ -11,6 +11,441 @@ from wepy.resampling.resamplers.resampler import Resampler
 from wepy.resampling.resamplers.clone_merge  import CloneMergeResampler
 from wepy.resampling.decisions.clone_merge import MultiCloneMergeDecision
 
+# optional dependencies
+
+# The kernels are compiled with caching on (see CACHE_KERNELS) so the
+# compiled code is saved next to this module (or under NUMBA_CACHE_DIR
+# if that isn't writable) and reused by later processes instead of
+# being compiled again. The arguments are always passed with the same
+# types so only one version of each kernel is compiled for each
+# precision.
+try:
+    from numba import njit, prange
+except ModuleNotFoundError:
+    # without numba the kernels below are just run as regular python
+    # functions
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+    prange = range
+
+# Fast math lets the compiler reorder and fuse floating point
+# operations in the kernels, which only changes results in the last
+# bits. Infinities are used for masking so the flags assuming there
+# are no infs or nans are not used. Set WEPY_FASTMATH=0 to get strict
+# IEEE arithmetic.
+if os.environ.get('WEPY_FASTMATH', '1') == '1':
+    FASTMATH_FLAGS = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+else:
+    FASTMATH_FLAGS = False
+
+# The numba cache is not keyed on the fastmath flags, so a cached fast
+# math build would be loaded even in strict mode. The strict kernels
+# are therefore never cached and are compiled in each process.
+CACHE_KERNELS = FASTMATH_FLAGS is not False
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _novelties_kernel(walker_weights, num_walker_copies, lpmin, use_weights):
+    """Calculates the novelty function values for all walkers.
+
+    See `REVOResampler._novelties` for details.
+
+    """
+
+    # only existing walkers with some weight are novel
+    exists = (walker_weights > 0) & (num_walker_copies > 0)
+
+    if use_weights:
+
+        # substitute a dummy value for the walkers that don't exist so
+        # we don't take the log of zero
+        weight_per_copy = np.where(exists,
+                                   walker_weights / np.where(exists, num_walker_copies, 1.0),
+                                   1.0)
+
+        novelties = np.maximum(np.log(weight_per_copy) - lpmin, 0.0)
+
+    else:
+
+        novelties = np.ones_like(walker_weights)
+
+    return np.where(exists, novelties, 0.0)
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _int_pow(x, exponent):
+    """Raises an array to a positive integer power by repeated squaring.
+
+    This takes a few multiplies for small exponents which is much
+    cheaper than a general power.
+
+    """
+
+    base = x.copy()
+
+    # square up to the lowest set bit so the result doesn't have to
+    # start from ones
+    while exponent % 2 == 0:
+        base *= base
+        exponent //= 2
+
+    result = base.copy()
+    exponent //= 2
+
+    while exponent > 0:
+        base *= base
+        if exponent % 2 == 1:
+            result *= base
+        exponent //= 2
+
+    return result
+
+@njit(cache=CACHE_KERNELS, parallel=True, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _pair_factors_kernel(distance_matrix, char_dist, dist_exponent):
+    """Calculates the distance factor, (d_ij/d_0)^alpha, of the
+    variation for every pair of walkers.
+
+    These only depend on the distances so they are calculated once
+    for each resampling. A walker does not contribute to its own
+    variation so the diagonal is zero. The factors are symmetric so
+    only the upper triangle is computed and then mirrored. The rows
+    are independent and are computed in parallel when compiled.
+
+    """
+
+    num_walkers = distance_matrix.shape[0]
+    inv_char_dist = 1.0 / char_dist
+
+    # small integer exponents, like the default of 4, are just a few
+    # multiplies
+    use_int_pow = (dist_exponent == int(dist_exponent)) and (1 <= dist_exponent <= 8)
+
+    upper_pair_factors = np.zeros_like(distance_matrix)
+    for i in prange(num_walkers):
+
+        ratios = distance_matrix[i, i+1:] * inv_char_dist
+
+        if use_int_pow:
+            upper_pair_factors[i, i+1:] = _int_pow(ratios, int(dist_exponent))
+        else:
+            upper_pair_factors[i, i+1:] = ratios ** dist_exponent
+
+    return upper_pair_factors + upper_pair_factors.T
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _variation_terms_kernel(walker_novelties, num_walker_copies, pair_factors):
+    """Calculates the intermediate terms of the variation from scratch.
+
+    Returns
+    -------
+
+    walker_factors : arraylike of float of shape (num_walkers)
+        The novelty of each walker scaled by its number of copies.
+
+    partial_variations : arraylike of float of shape (num_walkers)
+        The sum of the contributions of all the other walkers to each
+        walker.
+
+    """
+
+    # walkers that no longer exist contribute nothing
+    walker_factors = np.where(num_walker_copies > 0,
+                              walker_novelties * num_walker_copies,
+                              0.0)
+
+    # the product is done in the precision of the pair factors but
+    # the sums are kept in double precision
+    partial_variations = (pair_factors @ walker_factors.astype(pair_factors.dtype)
+                          ).astype(np.float64)
+
+    return walker_factors, partial_variations
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _update_variation_terms_kernel(changed_idxs,
+                                   walker_weights, num_walker_copies, pair_factors,
+                                   walker_novelties, walker_factors, partial_variations,
+                                   lpmin, use_weights):
+    """Updates the intermediate terms of the variation in place after
+    the weights or copies of only a few walkers have changed.
+
+    Only the pair factors of the changed walkers are needed so this is
+    linear in the number of walkers instead of quadratic.
+
+    Parameters
+    ----------
+
+    changed_idxs : arraylike of int
+        The indices of the walkers whose weights or copies changed.
+
+    """
+
+    new_novelties = _novelties_kernel(walker_weights[changed_idxs],
+                                      num_walker_copies[changed_idxs],
+                                      lpmin, use_weights)
+
+    for k in range(changed_idxs.shape[0]):
+        i = changed_idxs[k]
+
+        if num_walker_copies[i] > 0:
+            new_factor = new_novelties[k] * num_walker_copies[i]
+        else:
+            new_factor = 0.0
+
+        # the pair factors are symmetric so the row gives the
+        # contribution of this walker to all the others
+        delta = new_factor - walker_factors[i]
+        if delta != 0.0:
+            partial_variations += pair_factors[i] * delta
+
+        walker_novelties[i] = new_novelties[k]
+        walker_factors[i] = new_factor
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _variation_kernel(walker_novelties, num_walker_copies,
+                      walker_factors, partial_variations):
+    """Calculates the variation and the walker variation values from
+    their intermediate terms."""
+
+    # the walker variation values (Vi values)
+    walker_variations = np.where(num_walker_copies > 0,
+                                 walker_novelties * partial_variations,
+                                 0.0)
+
+    # the value to be optimized, each pair is counted twice in the
+    # full matrix product
+    variation = 0.5 * (walker_factors @ partial_variations)
+
+    return variation, walker_variations
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _calcvariation_kernel(walker_novelties, num_walker_copies, pair_factors):
+    """Calculates the variation and the walker variation values.
+
+    See `REVOResampler._calcvariation` for details.
+
+    """
+
+    walker_factors, partial_variations = _variation_terms_kernel(
+        walker_novelties, num_walker_copies, pair_factors)
+
+    return _variation_kernel(walker_novelties, num_walker_copies,
+                             walker_factors, partial_variations)
+
+@njit(cache=CACHE_KERNELS, fastmath=FASTMATH_FLAGS, error_model='numpy')
+def _decide_core(walker_weights, num_walker_copies, distance_matrix,
+                 pmin, pmax, merge_dist, char_dist, dist_exponent,
+                 lpmin, use_weights, rand_draws):
+    """The greedy variation optimization loop of REVO.
+
+    See `REVOResampler.decide` for details. This works only on arrays
+    so that it can be compiled.
+
+    Parameters
+    ----------
+
+    rand_draws : arraylike of float of shape (num_walkers)
+        Uniform random numbers in [0, 1) used, in order, to choose
+        which walker is kept in each merge.
+
+    Returns
+    -------
+
+    merge_group_heads : arraylike of int of shape (num_walkers)
+        The first walker squashed into each walker, or -1 if none
+        are.
+
+    merge_group_next : arraylike of int of shape (num_walkers)
+        The next walker in the merge group of each squashed walker,
+        or -1 at the end of the group.
+
+    walker_clone_nums : arraylike of int of shape (num_walkers)
+
+    variations : arraylike of float
+        The variation values after each step of the optimization.
+
+    """
+
+    num_walkers = walker_weights.shape[0]
+
+    # the merge groups as linked lists of the squashed walkers
+    # starting from the walker they are merged into, the tails are
+    # kept so groups can be joined without walking them
+    merge_group_heads = np.full(num_walkers, -1, dtype=np.int64)
+    merge_group_tails = np.full(num_walkers, -1, dtype=np.int64)
+    merge_group_next = np.full(num_walkers, -1, dtype=np.int64)
+    walker_clone_nums = np.zeros(num_walkers, dtype=np.int64)
+
+    # each accepted move squashes a walker so there can be at most
+    # num_walkers - 1 of them, and each adds two variation values
+    variations = np.zeros(2 * num_walkers + 1)
+    n_variations = 0
+    n_draws = 0
+
+    # make copy of walkers properties
+    new_walker_weights = walker_weights.copy()
+    new_num_walker_copies = num_walker_copies.copy()
+
+    # the distances don't change so neither do the pair factors
+    pair_factors = _pair_factors_kernel(distance_matrix, char_dist, dist_exponent)
+
+    # calculate the initial variation which will be optimized, the
+    # intermediate terms are kept so that they can be updated only
+    # for the walkers that change
+    walker_novelties = _novelties_kernel(new_walker_weights, new_num_walker_copies,
+                                         lpmin, use_weights)
+    walker_factors, partial_variations = _variation_terms_kernel(
+        walker_novelties, new_num_walker_copies, pair_factors)
+    variation, walker_variations = _variation_kernel(
+        walker_novelties, new_num_walker_copies, walker_factors, partial_variations)
+    variations[n_variations] = variation
+    n_variations += 1
+
+    productive = True
+    while productive:
+        productive = False
+
+        # initialize to -1, we may not find one of each
+        min_idx = -1
+        max_idx = -1
+
+        # selects a walker with maximum walker_variations (distance
+        # to other walkers) which will be tagged for cloning:
+        # 1. must have an amp >=1 which gives the number of clones to be made of it
+        # 2. clones for the given amplitude must not be smaller than the minimum probability
+        # 3. must not already be a keep merge target
+        cloneable = (new_num_walker_copies >= 1) & \
+                    (new_walker_weights / (new_num_walker_copies + 1) > pmin) & \
+                    (merge_group_heads == -1)
+        if cloneable.any():
+            # search backwards so that ties go to the last walker
+            masked_variations = np.where(cloneable, walker_variations, -np.inf)
+            max_idx = num_walkers - 1 - np.argmax(masked_variations[::-1])
+
+        # without a walker to clone no move can be made
+        if max_idx == -1:
+            break
+
+        # walker with the lowest walker_variations (distance to other
+        # walkers) will be tagged for merging, ties go to the first
+        # walker
+        mergeable = (new_num_walker_copies == 1) & (new_walker_weights < pmax)
+        if mergeable.any():
+            min_idx = np.argmin(np.where(mergeable, walker_variations, np.inf))
+
+        # does min_idx have an eligible merging partner? It must not
+        # violate pmax when merged and must be within the merge
+        # distance
+        closewalk = -1
+        if min_idx != -1 and min_idx != max_idx:
+
+            min_dists = distance_matrix[min_idx]
+
+            # mask of the eligible partners, then choose the closest
+            # of them in the same pass
+            eligible = (new_num_walker_copies == 1) & \
+                       (new_walker_weights + new_walker_weights[min_idx] < pmax) & \
+                       (min_dists < merge_dist)
+            eligible[min_idx] = False
+            eligible[max_idx] = False
+
+            if eligible.any():
+                closewalk = np.argmin(np.where(eligible, min_dists, np.inf))
+
+        #if we find a walker for cloning, a walker and its close neighbor for merging
+        if closewalk != -1:
+
+            # change new_amp
+            tempsum = new_walker_weights[min_idx] + new_walker_weights[closewalk]
+            new_num_walker_copies[min_idx] = new_walker_weights[min_idx]/tempsum
+            new_num_walker_copies[closewalk] = new_walker_weights[closewalk]/tempsum
+            new_num_walker_copies[max_idx] += 1
+
+            # re-determine variation function, and walker_variations
+            # values. If the move is rejected the loop ends so the
+            # terms don't need to be restored.
+            _update_variation_terms_kernel(
+                np.array([min_idx, closewalk, max_idx]),
+                new_walker_weights, new_num_walker_copies, pair_factors,
+                walker_novelties, walker_factors, partial_variations,
+                lpmin, use_weights)
+            new_variation, walker_variations = _variation_kernel(
+                walker_novelties, new_num_walker_copies, walker_factors, partial_variations)
+
+            if new_variation > variation:
+                variations[n_variations] = new_variation
+                n_variations += 1
+
+                productive = True
+                variation = new_variation
+
+                # make a decision on which walker to keep (min_idx,
+                # or closewalk) with probability proportional to
+                # their weights
+                r = rand_draws[n_draws] * (new_walker_weights[closewalk] +
+                                           new_walker_weights[min_idx])
+                n_draws += 1
+
+                # keeps closewalk and gets rid of min_idx
+                if r < new_walker_weights[closewalk]:
+                    keep_idx = closewalk
+                    squash_idx = min_idx
+
+                # keep min_idx, get rid of closewalk
+                else:
+                    keep_idx = min_idx
+                    squash_idx = closewalk
+
+                # update weight
+                new_walker_weights[keep_idx] += new_walker_weights[squash_idx]
+                new_walker_weights[squash_idx] = 0.0
+
+                # update new_num_walker_copies
+                new_num_walker_copies[squash_idx] = 0
+                new_num_walker_copies[keep_idx] = 1
+
+                # add the squash index to the merge group, followed by
+                # the walkers that were already in the merge group
+                # that was just squashed
+                merge_group_next[squash_idx] = merge_group_heads[squash_idx]
+                if merge_group_heads[squash_idx] == -1:
+                    new_tail = squash_idx
+                else:
+                    new_tail = merge_group_tails[squash_idx]
+
+                if merge_group_heads[keep_idx] == -1:
+                    merge_group_heads[keep_idx] = squash_idx
+                else:
+                    merge_group_next[merge_group_tails[keep_idx]] = squash_idx
+                merge_group_tails[keep_idx] = new_tail
+
+                # reset the merge group that was just squashed to empty
+                merge_group_heads[squash_idx] = -1
+                merge_group_tails[squash_idx] = -1
+
+                # increase the number of clones that the cloned
+                # walker has
+                walker_clone_nums[max_idx] += 1
+
+                # new variation for starting new stage
+                _update_variation_terms_kernel(
+                    np.array([keep_idx, squash_idx]),
+                    new_walker_weights, new_num_walker_copies, pair_factors,
+                    walker_novelties, walker_factors, partial_variations,
+                    lpmin, use_weights)
+                new_variation, walker_variations = _variation_kernel(
+                    walker_novelties, new_num_walker_copies, walker_factors, partial_variations)
+                variations[n_variations] = new_variation
+                n_variations += 1
+
+            # if not productive
+            else:
+                new_num_walker_copies[min_idx] = 1
+                new_num_walker_copies[closewalk] = 1
+                new_num_walker_copies[max_idx] -= 1
+
+    return merge_group_heads, merge_group_next, walker_clone_nums, variations[:n_variations]
+
 class REVOResampler(CloneMergeResampler):
     r"""Resampler implementing the REVO algorithm.
 
@@ -122,6 +557,8 @@ class REVOResampler(CloneMergeResampler):
                  pmax=0.1,
                  dist_exponent=4,
                  seed=None,
+                 num_image_workers=None,
+                 variation_dtype=np.float64,
                  **kwargs):
 
         """Constructor for the REVO Resampler.
@@ -158,6 +595,20 @@ class REVOResampler(CloneMergeResampler):
         seed : None or int, optional
             The random seed. If None, the system (random) one will be used.
 
+        num_image_workers : None or int, optional
+            The number of worker processes used to compute the images
+            of the walkers, e.g. `os.cpu_count()`. If None they are
+            computed serially in this process. Worth it when the
+            distance metric does expensive work in `image`.
+
+        variation_dtype : numpy dtype, optional
+            The precision of the distances and pair factors used in
+            the variation optimization. np.float32 halves the memory
+            traffic of the optimization but may make different
+            decisions when moves change the variation by less than
+            its precision. The variation itself is always summed in
+            double precision.
+
         """
 
         # call the init methods in the CloneMergeResampler
@@ -189,20 +640,40 @@ class REVOResampler(CloneMergeResampler):
 
         self.char_dist = char_dist
 
-        # setting the random seed
+        # setting the random seed, if None the generator is seeded
+        # from the system
         self.seed = seed
-        if seed is not None:
-            rand.seed(seed)
+        self._rng = np.random.default_rng(seed)
 
         # setting the weights parameter
         self.weights = weights
 
+        self.variation_dtype = variation_dtype
+
+        # the pool of processes for computing images, this is made
+        # when it is first needed
+        self.num_image_workers = num_image_workers
+        self._image_pool = None
+
         # we do not know the shape and dtype of the images until
         # runtime so we determine them here
 
         image = self.distance.image(init_state)
         self.image_dtype = image.dtype
 
+    def __getstate__(self):
+
+        # process pools can't be pickled, a new one is made when needed
+        state = self.__dict__.copy()
+        state['_image_pool'] = None
+
+        return state
+
+    def __del__(self):
+
+        if getattr(self, '_image_pool', None) is not None:
+            self._image_pool.shutdown(wait=False)
+
     def resampler_field_dtypes(self):
         """ Finds out the datatype of the image.
 
@@ -222,6 +693,29 @@ class REVOResampler(CloneMergeResampler):
 
         return tuple(dtypes)
 
+    def _novelties(self, walker_weights, num_walker_copies):
+        """Calculates the novelty function values for all walkers.
+
+        Parameters
+        ----------
+
+        walker_weights : arraylike of float
+            The weights of all walkers.
+
+        num_walker_copies : arraylike of int
+          The number of copies of each walker.
+
+        Returns
+        -------
+        novelties : arraylike of float
+        The calculated value of novelty for each walker.
+
+        """
+
+        return _novelties_kernel(np.asarray(walker_weights, dtype=np.float64),
+                                 np.asarray(num_walker_copies, dtype=np.float64),
+                                 float(self.lpmin), bool(self.weights))
+
     def _novelty(self, walker_weight, num_walker_copy):
         """Calculates the novelty fuction value.
 
@@ -241,23 +735,7 @@ class REVOResampler(CloneMergeResampler):
 
         """
 
-        novelty = 0
-
-        if walker_weight > 0 and num_walker_copy > 0:
-
-            if self.weights:
-
-                novelty = np.log(walker_weight/num_walker_copy) - self.lpmin
-
-            else:
-
-                novelty = 1
-
-        if novelty < 0:
-
-            novelty = 0
-
-        return novelty
+        return self._novelties([walker_weight], [num_walker_copy])[0]
 
     def _calcvariation(self, walker_weights, num_walker_copies, distance_matrix):
         """Calculates the variation value.
@@ -274,7 +752,7 @@ class REVOResampler(CloneMergeResampler):
             1 means there is one of the this walker.
             >1 means it should be cloned to this number of walkers.
 
-        distance_matrix : list of arraylike of shape (num_walkers)
+        distance_matrix : arraylike of shape (num_walkers, num_walkers)
 
         Returns
         -------
@@ -286,38 +764,15 @@ class REVOResampler(CloneMergeResampler):
 
         """
 
-        num_walkers = len(walker_weights)
-
-
+        num_walker_copies = np.asarray(num_walker_copies, dtype=np.float64)
 
         # set the novelty values
-        walker_novelties = np.array([self._novelty(walker_weights[i], num_walker_copies[i])
-                               for i in range(num_walkers)])
-
-
-        # the value to be optimized
-        variation = 0
-
-        # the walker variation values (Vi values)
-        walker_variations = np.zeros(num_walkers)
-
-
-        # calculate the variation and walker variation values
-        for i in range(num_walkers - 1):
-
-            if num_walker_copies[i] > 0:
-                for j in range(i+1, num_walkers):
-
-                    if num_walker_copies[j] > 0:
-
-                        partial_variation = ((distance_matrix[i][j] / self.char_dist) ** self.dist_exponent) \
-                        * walker_novelties[i] * walker_novelties[j]
+        walker_novelties = self._novelties(walker_weights, num_walker_copies)
 
-                        variation += partial_variation * num_walker_copies[i] * num_walker_copies[j]
-                        walker_variations[i] += partial_variation * num_walker_copies[j]
-                        walker_variations[j] += partial_variation * num_walker_copies[i]
+        pair_factors = _pair_factors_kernel(np.ascontiguousarray(distance_matrix, dtype=np.float64),
+                                            float(self.char_dist), float(self.dist_exponent))
 
-        return variation, walker_variations
+        return _calcvariation_kernel(walker_novelties, num_walker_copies, pair_factors)
 
     def decide(self, walker_weights, num_walker_copies, distance_matrix):
         """Optimize the trajectory variation by making decisions for resampling.
@@ -334,7 +789,7 @@ class REVOResampler(CloneMergeResampler):
             1 means there is one of the this walker.
             >1 means it should be cloned to this number of walkers.
 
-        distance_matrix : list of arraylike of shape (num_walkers)
+        distance_matrix : arraylike of shape (num_walkers, num_walkers)
 
         Returns
         -------
@@ -347,161 +802,38 @@ class REVOResampler(CloneMergeResampler):
         """
         num_walkers = len(walker_weights)
 
-        variations = []
-        merge_groups = [[] for i in range(num_walkers)]
-        walker_clone_nums = [0 for i in range(num_walkers)]
+        # convert the distance matrix once so that the variation
+        # calculations can work on the whole array
+        distance_matrix = np.ascontiguousarray(distance_matrix, dtype=self.variation_dtype)
 
-        # make copy of walkers properties
-        new_walker_weights = walker_weights.copy()
-        new_num_walker_copies = num_walker_copies.copy()
-
-
-        # calculate the initial variation which will be optimized
-        variation, walker_variations = self._calcvariation(walker_weights,
-                                                           new_num_walker_copies,
-                                                           distance_matrix)
-        variations.append(variation)
+        # the random numbers for choosing which walker is kept in a
+        # merge, there can't be more merges than walkers
+        rand_draws = self._rng.random(num_walkers)
 
         # maximize the variance through cloning and merging
-        logging.info("Starting variance optimization: {}".format(variation))
-
-        productive = True
-        while productive:
-            productive = False
-            # find min and max walker_variationss, alter new_amp
-
-            # initialize to None, we may not find one of each
-            min_idx = None
-            max_idx = None
-
-            # selects a walker with minimum walker_variations and a walker with
-            # maximum walker_variations walker (distance to other walkers) will be
-            # tagged for cloning (stored in maxwind), except if it is
-            # already a keep merge target
-            max_tups = []
-            for i, value in enumerate(walker_variations):
-                # 1. must have an amp >=1 which gives the number of clones to be made of it
-                # 2. clones for the given amplitude must not be smaller than the minimum probability
-                # 3. must not already be a keep merge target
-                if (new_num_walker_copies[i] >= 1) and \
-                   (new_walker_weights[i]/(new_num_walker_copies[i] + 1) > self.pmin) and \
-                   (len(merge_groups[i]) == 0):
-                    max_tups.append((value, i))
-
-
-            if len(max_tups) > 0:
-                max_value, max_idx = max(max_tups)
-
-            # walker with the lowest walker_variations (distance to other walkers)
-            # will be tagged for merging (stored in min_idx)
-            min_tups = [(value, i) for i,value in enumerate(walker_variations)
-                        if new_num_walker_copies[i] == 1 and (new_walker_weights[i]  < self.pmax)]
-
-            if len(min_tups) > 0:
-                min_value, min_idx = min(min_tups)
-
-            # does min_idx have an eligible merging partner?
-            # closedist = self.merge_dist
-            closewalk = None
-            condition_list = np.array([i is not None for i in [min_idx, max_idx]])
-            if condition_list.all() and min_idx != max_idx:
-
-                # get the walkers that aren't the minimum and the max
-                # walker_variations walkers, as candidates for merging
-                closewalks = set(range(num_walkers)).difference([min_idx, max_idx])
-
-                # remove those walkers that if they were merged with
-                # the min walker_variations walker would violate the pmax
-                closewalks = [idx for idx in closewalks
-                                      if (new_num_walker_copies[idx]==1) and
-                                       (new_walker_weights[idx] + new_walker_weights[min_idx] < self.pmax)
-                                      ]
-
-                # if there are any walkers left, get the distances of
-                # the close walkers to the min walker_variations walker if that
-                # distance is less than the maximum merge distance
-                if len(closewalks) > 0:
-                    closewalks_dists = [(distance_matrix[min_idx][i], i) for i in closewalks
-                                            if distance_matrix[min_idx][i] < (self.merge_dist)]
-
-                    # if any were found set this as the closewalk
-                    if len(closewalks_dists) > 0:
-                        closedist, closewalk = min(closewalks_dists)
-
-
-            # did we find a closewalk?
-            condition_list = np.array([i is not None for i in [min_idx, max_idx, closewalk]])
-            #if we find a walker for cloning, a walker and its close neighbor for merging
-            if condition_list.all() :
-
-                # change new_amp
-                tempsum = new_walker_weights[min_idx] + new_walker_weights[closewalk]
-                new_num_walker_copies[min_idx] = new_walker_weights[min_idx]/tempsum
-                new_num_walker_copies[closewalk] = new_walker_weights[closewalk]/tempsum
-                new_num_walker_copies[max_idx] += 1
-
-                # re-determine variation function, and walker_variations values
-                new_variation, walker_variations = self._calcvariation(new_walker_weights, new_num_walker_copies, distance_matrix)
-
-                if new_variation > variation:
-                    variations.append(new_variation)
-
-                    logging.info("Variance move to {} accepted".format(new_variation))
-
-                    productive = True
-                    variation = new_variation
-
-                    # make a decision on which walker to keep
-                    # (min_idx, or closewalk), equivalent to:
-                    # `random.choices([closewalk, min_idx],
-                    #                 weights=[new_walker_weights[closewalk], new_walker_weights[min_idx])`
-                    r = rand.uniform(0.0, new_walker_weights[closewalk] + new_walker_weights[min_idx])
-
-                     # keeps closewalk and gets rid of min_idx
-                    if r < new_walker_weights[closewalk]:
-                        keep_idx = closewalk
-                        squash_idx = min_idx
-
-                    # keep min_idx, get rid of closewalk
-                    else:
-                        keep_idx = min_idx
-                        squash_idx = closewalk
-
-                    # update weight
-                    new_walker_weights[keep_idx] += new_walker_weights[squash_idx]
-                    new_walker_weights[squash_idx] = 0.0
-
-                    # update new_num_walker_copies
-                    new_num_walker_copies[squash_idx] = 0
-                    new_num_walker_copies[keep_idx] = 1
-
-                    # add the squash index to the merge group
-                    merge_groups[keep_idx].append(squash_idx)
-
-                    # add the indices of the walkers that were already
-                    # in the merge group that was just squashed
-                    merge_groups[keep_idx].extend(merge_groups[squash_idx])
-
-                    # reset the merge group that was just squashed to empty
-                    merge_groups[squash_idx] = []
-
-                    # increase the number of clones that the cloned
-                    # walker has
-                    walker_clone_nums[max_idx] += 1
-
-                    # new variation for starting new stage
-                    new_variation, walker_variations = self._calcvariation(new_walker_weights,
-                                                                          new_num_walker_copies,
-                                                                          distance_matrix)
-                    variations.append(new_variation)
-
-                    logging.info("variance after selection: {}".format(new_variation))
-
-                # if not productive
-                else:
-                    new_num_walker_copies[min_idx] = 1
-                    new_num_walker_copies[closewalk] = 1
-                    new_num_walker_copies[max_idx] -= 1
+        merge_group_heads, merge_group_next, walker_clone_nums, variations = \
+            _decide_core(np.asarray(walker_weights, dtype=np.float64),
+                         np.asarray(num_walker_copies, dtype=np.float64),
+                         distance_matrix,
+                         float(self.pmin), float(self.pmax), float(self.merge_dist),
+                         float(self.char_dist), float(self.dist_exponent),
+                         float(self.lpmin), bool(self.weights),
+                         rand_draws)
+
+        logging.info("Starting variance optimization: {}".format(variations[0]))
+        logging.info("Optimized variance: {}".format(variations[-1]))
+
+        # walk the linked lists to get the merge groups, as python
+        # ints since indexing arrays one element at a time is slow
+        merge_group_next = merge_group_next.tolist()
+        merge_groups = []
+        for squash_idx in merge_group_heads.tolist():
+            merge_group = []
+            while squash_idx != -1:
+                merge_group.append(squash_idx)
+                squash_idx = merge_group_next[squash_idx]
+            merge_groups.append(merge_group)
+        walker_clone_nums = walker_clone_nums.tolist()
 
         # given we know what we want to clone to specific slots
         # (squashing other walkers) we need to determine where these
@@ -517,6 +849,46 @@ class REVOResampler(CloneMergeResampler):
 
         return walker_actions, variations[-1]
 
+    def _walker_images(self, walkers):
+        """Compute the images of the walker states, in parallel if
+        image workers were requested.
+
+        Parameters
+        ----------
+        walkers : list of walkers
+
+        Returns
+        -------
+        images : list of image object
+
+        """
+
+        states = [walker.state for walker in walkers]
+
+        if (self.num_image_workers is not None and self.num_image_workers > 1
+                and self._image_pool is None):
+
+            # if the distance can't be sent to the workers compute the
+            # images serially from now on
+            try:
+                pickle.dumps(self.distance)
+            except (pickle.PicklingError, AttributeError, TypeError) as err:
+                logging.warning("Could not send the distance to image workers, "
+                                "computing images serially instead: {}".format(err))
+                self.num_image_workers = None
+            else:
+                self._image_pool = cf.ProcessPoolExecutor(max_workers=self.num_image_workers)
+
+        if self._image_pool is not None:
+
+            chunksize = max(1, len(states) // (4 * self.num_image_workers))
+
+            return list(self._image_pool.map(self.distance.image, states,
+                                             chunksize=chunksize))
+
+        image = self.distance.image
+        return [image(state) for state in states]
+
     def _all_to_all_distance(self, walkers):
         """ Calculate the pairwise all-to-all distances between walkers.
 
@@ -527,31 +899,18 @@ class REVOResampler(CloneMergeResampler):
 
         Returns
         -------
-        distance_matrix : list of arraylike of shape (num_walkers)
+        distance_matrix : arraylike of shape (num_walkers, num_walkers)
 
         images : list of image obeject
 
         """
-        # initialize an all-to-all matrix, with 0.0 for self distances
-        dist_mat = np.zeros((len(walkers), len(walkers)))
-
         # make images for all the walker states for us to compute distances on
-        images = []
-        for walker in walkers:
-            image = self.distance.image(walker.state)
-            images.append(image)
-
-        # get the combinations of indices for all walker pairs
-        for i, j in it.combinations(range(len(images)), 2):
-
-            # calculate the distance between the two walkers
-            dist = self.distance.image_distance(images[i], images[j])
+        images = self._walker_images(walkers)
 
-            # save this in the matrix in both spots
-            dist_mat[i][j] = dist
-            dist_mat[j][i] = dist
+        # compute the distances between all of them
+        dist_mat = self.distance.image_distance_matrix(images)
 
-        return [walker_dists for walker_dists in dist_mat], images
+        return dist_mat, images
 
     @log_call(include_args=[],
               include_result=False)
@@ -583,8 +942,9 @@ class REVOResampler(CloneMergeResampler):
         # calculate distance matrix
         distance_matrix, images = self._all_to_all_distance(walkers)
 
+        # let logging format the matrix only if it will be shown
         logging.info("distance_matrix")
-        logging.info("\n{}".format(str(np.array(distance_matrix))))
+        logging.info("\n%s", distance_matrix)
 
         # determine cloning and merging actions to be performed, by
         # maximizing the variation, i.e. the Decider
@@ -592,7 +952,7 @@ class REVOResampler(CloneMergeResampler):
 
         # convert the target idxs and decision_id to feature vector arrays
         for record in resampling_data:
-            record['target_idxs'] = np.array(record['target_idxs'])
+            record['target_idxs'] = np.asarray(record['target_idxs'])
             record['decision_id'] = np.array([record['decision_id']])
 
         # actually do the cloning and merging of the walkers
@@ -600,7 +960,7 @@ class REVOResampler(CloneMergeResampler):
 
        # flatten the distance matrix and give the number of walkers
         # as well for the resampler data, there is just one per cycle
-        resampler_data = [{'distance_matrix' : np.ravel(np.array(distance_matrix)),
+        resampler_data = [{'distance_matrix' : distance_matrix.reshape(-1),
                            'num_walkers' : np.array([len(walkers)]),
                            'variation' : np.array([variation]),
                            'images' : np.ravel(np.array(images)),
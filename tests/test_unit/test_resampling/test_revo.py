@@ -0,0 +1,333 @@
+import numpy as np
+
+from wepy.resampling.resamplers.revo import (
+    _novelties_kernel,
+    _pair_factors_kernel,
+    _variation_terms_kernel,
+    _update_variation_terms_kernel,
+    _variation_kernel,
+    _calcvariation_kernel,
+    _decide_core,
+)
+from wepy.resampling.distances.distance import Distance, XYEuclideanDistance
+from wepy.resampling.distances.randomwalk import RandomWalkDistance
+
+NUM_WALKERS = 20
+CHAR_DIST = 0.5
+DIST_EXPONENT = 4
+LPMIN = np.log(1e-12/100)
+
+def gen_system(seed=0):
+
+    rng = np.random.RandomState(seed)
+
+    weights = rng.random_sample(NUM_WALKERS)
+    weights /= weights.sum()
+
+    positions = rng.random_sample((NUM_WALKERS, 3))
+    distance_matrix = np.sqrt(((positions[:, None, :] - positions[None, :, :])**2).sum(axis=-1))
+
+    return weights, np.ones(NUM_WALKERS), distance_matrix
+
+def reference_variation(walker_weights, num_walker_copies, distance_matrix,
+                        char_dist, dist_exponent, lpmin, use_weights):
+    """Straightforward loop version of the REVO variation."""
+
+    num_walkers = len(walker_weights)
+
+    walker_novelties = []
+    for weight, num_copies in zip(walker_weights, num_walker_copies):
+        novelty = 0
+        if weight > 0 and num_copies > 0:
+            if use_weights:
+                novelty = max(np.log(weight / num_copies) - lpmin, 0)
+            else:
+                novelty = 1
+        walker_novelties.append(novelty)
+
+    variation = 0
+    walker_variations = np.zeros(num_walkers)
+    for i in range(num_walkers - 1):
+        if num_walker_copies[i] > 0:
+            for j in range(i+1, num_walkers):
+                if num_walker_copies[j] > 0:
+
+                    partial_variation = ((distance_matrix[i][j] / char_dist) ** dist_exponent) \
+                        * walker_novelties[i] * walker_novelties[j]
+
+                    variation += partial_variation * num_walker_copies[i] * num_walker_copies[j]
+                    walker_variations[i] += partial_variation * num_walker_copies[j]
+                    walker_variations[j] += partial_variation * num_walker_copies[i]
+
+    return variation, walker_variations
+
+def reference_decide(walker_weights, num_walker_copies, distance_matrix,
+                     pmin, pmax, merge_dist, char_dist, dist_exponent,
+                     lpmin, use_weights, rand_draws):
+    """Straightforward loop version of the REVO greedy optimization,
+    returning the merge groups as lists."""
+
+    num_walkers = len(walker_weights)
+    rand_draws = iter(rand_draws)
+
+    variations = []
+    merge_groups = [[] for i in range(num_walkers)]
+    walker_clone_nums = [0 for i in range(num_walkers)]
+
+    new_walker_weights = list(walker_weights)
+    new_num_walker_copies = list(num_walker_copies)
+
+    def calcvariation():
+        return reference_variation(new_walker_weights, new_num_walker_copies,
+                                   distance_matrix, char_dist, dist_exponent,
+                                   lpmin, use_weights)
+
+    variation, walker_variations = calcvariation()
+    variations.append(variation)
+
+    productive = True
+    while productive:
+        productive = False
+
+        # ties for the max go to the last walker and ties for the
+        # min to the first one
+        max_tups = [(value, i) for i, value in enumerate(walker_variations)
+                    if (new_num_walker_copies[i] >= 1) and
+                    (new_walker_weights[i] / (new_num_walker_copies[i] + 1) > pmin) and
+                    (len(merge_groups[i]) == 0)]
+        if len(max_tups) == 0:
+            break
+        _, max_idx = max(max_tups)
+
+        min_tups = [(value, i) for i, value in enumerate(walker_variations)
+                    if new_num_walker_copies[i] == 1 and new_walker_weights[i] < pmax]
+        if len(min_tups) == 0:
+            break
+        _, min_idx = min(min_tups)
+        if min_idx == max_idx:
+            break
+
+        closewalks = [(distance_matrix[min_idx][i], i) for i in range(num_walkers)
+                      if i not in (min_idx, max_idx) and
+                      new_num_walker_copies[i] == 1 and
+                      new_walker_weights[i] + new_walker_weights[min_idx] < pmax and
+                      distance_matrix[min_idx][i] < merge_dist]
+        if len(closewalks) == 0:
+            break
+        _, closewalk = min(closewalks)
+
+        tempsum = new_walker_weights[min_idx] + new_walker_weights[closewalk]
+        new_num_walker_copies[min_idx] = new_walker_weights[min_idx] / tempsum
+        new_num_walker_copies[closewalk] = new_walker_weights[closewalk] / tempsum
+        new_num_walker_copies[max_idx] += 1
+
+        new_variation, walker_variations = calcvariation()
+
+        if new_variation > variation:
+            variations.append(new_variation)
+            productive = True
+            variation = new_variation
+
+            r = next(rand_draws) * (new_walker_weights[closewalk] +
+                                    new_walker_weights[min_idx])
+            if r < new_walker_weights[closewalk]:
+                keep_idx, squash_idx = closewalk, min_idx
+            else:
+                keep_idx, squash_idx = min_idx, closewalk
+
+            new_walker_weights[keep_idx] += new_walker_weights[squash_idx]
+            new_walker_weights[squash_idx] = 0.0
+            new_num_walker_copies[squash_idx] = 0
+            new_num_walker_copies[keep_idx] = 1
+
+            merge_groups[keep_idx].append(squash_idx)
+            merge_groups[keep_idx].extend(merge_groups[squash_idx])
+            merge_groups[squash_idx] = []
+
+            walker_clone_nums[max_idx] += 1
+
+            new_variation, walker_variations = calcvariation()
+            variations.append(new_variation)
+
+    return merge_groups, walker_clone_nums, variations
+
+def run_decide_core(walker_weights, num_walker_copies, distance_matrix, *params):
+    """Run the compiled decide loop and convert its linked list merge
+    groups to lists."""
+
+    merge_group_heads, merge_group_next, walker_clone_nums, variations = \
+        _decide_core(np.asarray(walker_weights, dtype=np.float64),
+                     np.asarray(num_walker_copies, dtype=np.float64),
+                     np.ascontiguousarray(distance_matrix, dtype=np.float64),
+                     *params)
+
+    merge_groups = []
+    for squash_idx in merge_group_heads.tolist():
+        merge_group = []
+        while squash_idx != -1:
+            merge_group.append(squash_idx)
+            squash_idx = int(merge_group_next[squash_idx])
+        merge_groups.append(merge_group)
+
+    return merge_groups, walker_clone_nums.tolist(), variations
+
+class TestREVOVariation():
+
+    def test_incremental_update(self):
+
+        weights, copies, distance_matrix = gen_system()
+
+        pair_factors = _pair_factors_kernel(distance_matrix, CHAR_DIST, DIST_EXPONENT)
+
+        novelties = _novelties_kernel(weights, copies, LPMIN, True)
+        walker_factors, partial_variations = _variation_terms_kernel(
+            novelties, copies, pair_factors)
+
+        # a clone and a merge like the ones made in decide
+        tempsum = weights[3] + weights[7]
+        copies[3] = weights[3] / tempsum
+        copies[7] = weights[7] / tempsum
+        copies[12] += 1
+
+        _update_variation_terms_kernel(np.array([3, 7, 12]),
+                                       weights, copies, pair_factors,
+                                       novelties, walker_factors, partial_variations,
+                                       LPMIN, True)
+
+        variation, walker_variations = _variation_kernel(novelties, copies,
+                                                         walker_factors, partial_variations)
+
+        full_variation, full_walker_variations = _calcvariation_kernel(
+            _novelties_kernel(weights, copies, LPMIN, True),
+            copies, pair_factors)
+
+        assert np.isclose(variation, full_variation)
+        assert np.allclose(walker_variations, full_walker_variations)
+
+        # then squash one of the merged walkers
+        weights[3] += weights[7]
+        weights[7] = 0.0
+        copies[3] = 1
+        copies[7] = 0
+
+        _update_variation_terms_kernel(np.array([3, 7]),
+                                       weights, copies, pair_factors,
+                                       novelties, walker_factors, partial_variations,
+                                       LPMIN, True)
+
+        variation, walker_variations = _variation_kernel(novelties, copies,
+                                                         walker_factors, partial_variations)
+
+        full_variation, full_walker_variations = _calcvariation_kernel(
+            _novelties_kernel(weights, copies, LPMIN, True),
+            copies, pair_factors)
+
+        assert np.isclose(variation, full_variation)
+        assert np.allclose(walker_variations, full_walker_variations)
+
+class TestREVODecide():
+
+    def check_decide(self, walker_weights, num_walker_copies, distance_matrix, params):
+
+        merge_groups, walker_clone_nums, variations = run_decide_core(
+            walker_weights, num_walker_copies, distance_matrix, *params)
+        ref_merge_groups, ref_walker_clone_nums, ref_variations = reference_decide(
+            walker_weights, num_walker_copies, distance_matrix, *params)
+
+        assert merge_groups == ref_merge_groups
+        assert walker_clone_nums == ref_walker_clone_nums
+        assert np.allclose(variations, ref_variations)
+
+        # every squashed walker is paid for with a clone
+        assert sum(len(group) for group in merge_groups) == sum(walker_clone_nums)
+
+        return merge_groups, walker_clone_nums, variations
+
+    def test_random_systems(self):
+
+        n_merges = 0
+        for seed in range(20):
+            rng = np.random.RandomState(seed)
+
+            weights, copies, distance_matrix = gen_system(seed)
+            rand_draws = rng.random_sample(NUM_WALKERS)
+
+            pmax = rng.uniform(0.1, 0.9)
+            merge_dist = rng.uniform(0.2, 1.0)
+
+            merge_groups, _, _ = self.check_decide(
+                weights, copies, distance_matrix,
+                (1e-12, pmax, merge_dist, CHAR_DIST, float(DIST_EXPONENT),
+                 LPMIN, bool(seed % 4), rand_draws))
+
+            n_merges += sum(len(group) for group in merge_groups)
+
+        # make sure the systems actually exercise the merging
+        assert n_merges > 0
+
+    def test_ties(self):
+
+        # with equal weights that are powers of two, integer
+        # distances, and no weighting of the novelty every value is
+        # exact so the walker variations have real ties
+        num_walkers = 8
+        weights = np.full(num_walkers, 1 / num_walkers)
+        copies = np.ones(num_walkers)
+
+        rng = np.random.RandomState(0)
+        distances = rng.randint(1, 3, size=(num_walkers, num_walkers)).astype(float)
+        distance_matrix = np.triu(distances, k=1)
+        distance_matrix += distance_matrix.T
+
+        _, walker_variations = reference_variation(weights, copies, distance_matrix,
+                                                   1.0, 2.0, LPMIN, False)
+        assert len(set(walker_variations)) < num_walkers
+
+        merge_groups, walker_clone_nums, _ = self.check_decide(
+            weights, copies, distance_matrix,
+            (1e-12, 0.9, 3.0, 1.0, 2.0, LPMIN, False, rng.random_sample(num_walkers)))
+
+        assert sum(walker_clone_nums) > 0
+
+    def test_no_clone_candidates(self):
+
+        weights, copies, distance_matrix = gen_system()
+
+        # no walker can be split without going below pmin so the
+        # optimization stops right away
+        merge_groups, walker_clone_nums, variations = self.check_decide(
+            weights, copies, distance_matrix,
+            (1.0, 0.5, 1.0, CHAR_DIST, float(DIST_EXPONENT), LPMIN, True,
+             np.zeros(NUM_WALKERS)))
+
+        assert merge_groups == [[] for i in range(NUM_WALKERS)]
+        assert walker_clone_nums == [0 for i in range(NUM_WALKERS)]
+        assert len(variations) == 1
+
+class TestImageDistanceMatrix():
+
+    def check_distance_matrix(self, distance, images):
+
+        distance_matrix = distance.image_distance_matrix(images)
+        pairwise_distance_matrix = Distance.image_distance_matrix(distance, images)
+
+        assert distance_matrix.shape == (len(images), len(images))
+        assert np.allclose(distance_matrix, pairwise_distance_matrix)
+
+    def test_xy_euclidean(self):
+
+        rng = np.random.RandomState(0)
+        images = list(rng.random_sample((NUM_WALKERS, 2)))
+
+        self.check_distance_matrix(XYEuclideanDistance(), images)
+
+    def test_randomwalk(self):
+
+        rng = np.random.RandomState(0)
+        positions = rng.randint(0, 10, size=(NUM_WALKERS, 3)).astype(float)
+
+        # the images can be flat or have the (1, N) shape of the
+        # random walk runner's positions
+        self.check_distance_matrix(RandomWalkDistance(), list(positions))
+        self.check_distance_matrix(RandomWalkDistance(),
+                                   [position.reshape(1, -1) for position in positions])